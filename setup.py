@@ -1,13 +1,31 @@
-from setuptools import setup, find_packages
+from setuptools import setup, find_packages, Extension
 
 with open('requirements.txt') as f:
     requirements = f.read().splitlines()
 
+# The CoAP header parser is compiled when Cython is available, otherwise the pure Python module is used
+try:
+    from Cython.Build import cythonize
+
+    ext_modules = cythonize(
+        [
+            Extension(
+                'source.coap_core.coap_packet.coap_parse',
+                ['source/coap_core/coap_packet/coap_parse.py'],
+                extra_compile_args=['-O3', '-march=native'],
+            ),
+        ],
+        compiler_directives={'language_level': 3},
+    )
+except ImportError:
+    ext_modules = []
+
 setup(
     name='share_drive',
     version='1.0.0',
     packages=find_packages(),
     install_requires=requirements,
+    ext_modules=ext_modules,
     entry_points={
         'console_scripts': [
             'share-drive-client = source.share_drive_client.client:main',
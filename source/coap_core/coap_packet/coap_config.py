@@ -1,4 +1,5 @@
 from enum import Enum
+from functools import lru_cache
 
 
 class CoapType(Enum):
@@ -12,10 +13,11 @@ class CoapType(Enum):
 
     @staticmethod
     def is_valid(item):
-        for member in CoapType:
-            if member.value == item:
-                return True
-        return False
+        return item in CoapType._VALUES
+
+
+# Set after the class body, where every attribute would become an enum member
+CoapType._VALUES = frozenset(member.value for member in CoapType)
 
 
 class CoapCodeFormat(Enum):
@@ -73,29 +75,18 @@ class CoapCodeFormat(Enum):
 
     @staticmethod
     def is_method(code):
-        return (code == CoapCodeFormat.GET.value() or
-                code == CoapCodeFormat.PUT.value() or
-                code == CoapCodeFormat.POST.value() or
-                code == CoapCodeFormat.DELETE.value() or
-                code == CoapCodeFormat.FETCH.value())
+        return code in CoapCodeFormat._METHOD_VALUES
 
     @staticmethod
     def is_success(code):
-        return (code == CoapCodeFormat.SUCCESS_CONTENT.value() or
-                code == CoapCodeFormat.SUCCESS_CHANGED.value() or
-                code == CoapCodeFormat.SUCCESS_VALID.value() or
-                code == CoapCodeFormat.SUCCESS_CREATED.value() or
-                code == CoapCodeFormat.SUCCESS_DELETED.value() or
-                code == CoapCodeFormat.SUCCESS_CONTINUE.value())
+        return code in CoapCodeFormat._SUCCESS_VALUES
 
     @staticmethod
     def is_valid(item):
-        for member in CoapCodeFormat:
-            if member.value() == item:
-                return True
-        return False
+        return item in CoapCodeFormat._VALUES
 
     @staticmethod
+    @lru_cache(maxsize=256)
     def get_field_name(value):
         for member in CoapCodeFormat:
             if member.value() == value:
@@ -103,6 +94,16 @@ class CoapCodeFormat(Enum):
         return None
 
 
+CoapCodeFormat._VALUES = frozenset(member.value() for member in CoapCodeFormat)
+CoapCodeFormat._METHOD_VALUES = frozenset(member.value() for member in (
+    CoapCodeFormat.GET, CoapCodeFormat.PUT, CoapCodeFormat.POST, CoapCodeFormat.DELETE, CoapCodeFormat.FETCH
+))
+CoapCodeFormat._SUCCESS_VALUES = frozenset(member.value() for member in (
+    CoapCodeFormat.SUCCESS_CONTENT, CoapCodeFormat.SUCCESS_CHANGED, CoapCodeFormat.SUCCESS_VALID,
+    CoapCodeFormat.SUCCESS_CREATED, CoapCodeFormat.SUCCESS_DELETED, CoapCodeFormat.SUCCESS_CONTINUE
+))
+
+
 class CoapOptionDelta(Enum):
     """
     Enum class representing CoAP option deltas.
@@ -152,15 +153,10 @@ class CoapOptionDelta(Enum):
 
     @staticmethod
     def is_valid(items: dict):
-        if len(items) > 0:
-            for item in items:
-                valid_item = False
-                for member in CoapOptionDelta:
-                    if member.value == item:
-                        valid_item = True
-                if not valid_item:
-                    return False
-        return True
+        return CoapOptionDelta._VALUES.issuperset(items)
+
+
+CoapOptionDelta._VALUES = frozenset(member.value for member in CoapOptionDelta)
 
 
 class CoapContentFormat(Enum):
@@ -176,7 +172,7 @@ class CoapContentFormat(Enum):
 
     @staticmethod
     def is_valid(item):
-        for member in CoapContentFormat:
-            if member.value == item:
-                return True
-        return False
+        return item in CoapContentFormat._VALUES
+
+
+CoapContentFormat._VALUES = frozenset(member.value for member in CoapContentFormat)
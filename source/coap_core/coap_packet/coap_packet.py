@@ -1,8 +1,10 @@
 import json
-from copy import deepcopy
 from socket import socket
 
 from source.coap_core.coap_packet.coap_config import CoapOptionDelta, CoapContentFormat
+from source.coap_core.coap_packet.coap_parse import parse_header
+
+PAYLOAD_MARKER = b"\xff"
 
 
 class CoapPacket:
@@ -14,6 +16,8 @@ class CoapPacket:
 
     Reference: https://datatracker.ietf.org/doc/html/rfc7252#autoid-9
     """
+    __slots__ = ("is_dummy", "needs_internal_computation", "version", "message_type", "token", "code", "message_id",
+                 "options", "__payload", "sender_ip_port", "skt", "_short_term_id", "_long_term_id")
 
     @staticmethod
     def decode_option_block(option) -> dict:
@@ -165,6 +169,15 @@ class CoapPacket:
             options (dict): Dictionary of CoAP options.
             payload (bytes): Payload of the CoAP packet.
         """
+        self.reset(version, message_type, token, code, message_id, options, payload, sender_ip_port, skt)
+
+    def reset(self, version=0, message_type=0, token=b"", code=0,
+              message_id=0, options=None, payload: bytes | str = None, sender_ip_port: tuple = (),
+              skt: socket = None):
+        """
+        Overwrite every field of the packet, so an existing instance can be reused instead of allocating a new one.
+        The arguments are the same as for the constructor; the options dictionary is kept by reference.
+        """
         if version == 0:
             self.is_dummy = True
         else:
@@ -177,11 +190,38 @@ class CoapPacket:
         self.token = token
         self.code = code
         self.message_id = message_id
-        self.options = options or {}
+        self.options = options if options is not None else {}
         self.__payload = payload or b""
         self.sender_ip_port = sender_ip_port
         self.skt = skt
 
+        # work ids, computed on first use
+        self._short_term_id = None
+        self._long_term_id = None
+
+    def clone(self) -> 'CoapPacket':
+        """
+        Return a copy of the packet that can be modified independently.
+
+        The options dictionary is copied, every other field is immutable and shared; the cached work ids are not kept.
+        """
+        copy = CoapPacket.__new__(CoapPacket)
+        copy.is_dummy = self.is_dummy
+        copy.needs_internal_computation = self.needs_internal_computation
+        copy.version = self.version
+        copy.message_type = self.message_type
+        copy.token = self.token
+        copy.code = self.code
+        copy.message_id = self.message_id
+        copy.options = self.options.copy()
+        copy.__payload = self.__payload
+        copy.sender_ip_port = self.sender_ip_port
+        copy.skt = self.skt
+        # the copy usually gets another token or message id, so its work ids are computed again
+        copy._short_term_id = None
+        copy._long_term_id = None
+        return copy
+
     @property
     def payload(self):
         return self.__payload
@@ -202,16 +242,30 @@ class CoapPacket:
         return CoapOptionDelta.BLOCK1.value in self.options or CoapOptionDelta.BLOCK2.value in self.options
 
     def short_term_work_id(self, message_id_extension=None) -> tuple:
+        """
+        The id is cached on first use: the sender, token and message id must not change afterwards.
+        """
         if message_id_extension:
             return self.sender_ip_port, self.token, self.message_id, message_id_extension
-        return self.sender_ip_port, self.token, self.message_id
+
+        work_id = self._short_term_id
+        if work_id is None:
+            work_id = self._short_term_id = (self.sender_ip_port, self.token, self.message_id)
+        return work_id
 
     def long_term_work_id(self) -> tuple:
-        block_id = self.get_block_id()
-        if block_id:
-            return self.short_term_work_id(), block_id
-        else:
-            return self.short_term_work_id()
+        """
+        The id is cached on first use, like the short term one; the block option must not change afterwards either.
+        """
+        work_id = self._long_term_id
+        if work_id is None:
+            block_id = self.get_block_id()
+            if block_id:
+                work_id = self.short_term_work_id(), block_id
+            else:
+                work_id = self.short_term_work_id()
+            self._long_term_id = work_id
+        return work_id
 
     def general_work_id(self) -> tuple:
         return self.sender_ip_port, self.token
@@ -251,59 +305,118 @@ class CoapPacket:
             prev_option_delta = delta
 
         # CoAP Payload
-        if self.payload:
-            if CoapOptionDelta.CONTENT_FORMAT.value in self.options:
-                if self.options[CoapOptionDelta.CONTENT_FORMAT.value] == CoapContentFormat.TEXT_PLAIN_UTF8.value:
-                    payload_bytes = bytes([0xFF]) + bytes(self.payload.encode(encoding="utf-8"))
-                elif self.options[CoapOptionDelta.CONTENT_FORMAT.value] == CoapContentFormat.APPLICATION_JSON.value:
-                    if not isinstance(self.payload, str):
-                        self.payload = json.dumps(self.payload)
-                    payload_bytes = bytes([0xFF]) + bytes(self.payload.encode(encoding="utf-8"))
-                else:
-                    payload_bytes = bytes([0xFF]) + bytes(self.payload)
-            else:
-
-                payload_bytes = bytes([0xFF]) + bytes(self.payload)
-        else:
-            payload_bytes = bytes([0xFF])
+        payload_bytes = self.__encode_payload()
 
         # Combine all parts to form the CoAP packet
         coap_packet = header + token_bytes + options_bytes + payload_bytes
 
         return coap_packet
 
+    def encode_into(self, buffer) -> int:
+        """
+        Encode the CoAP packet like encode(), but into a preallocated writable buffer (bytearray or memoryview),
+        so the packets sent on the hot path do not allocate their byte representation.
+
+        Args:
+            buffer: Buffer written from its start.
+
+        Returns:
+            int: Number of bytes written.
+
+        Raises:
+            ValueError: When the encoded packet does not fit in the buffer.
+        """
+        token = self.token
+        message_id = self.message_id
+        if len(buffer) < 4:
+            raise ValueError("The buffer is too small for the CoAP packet")
+
+        # CoAP Header
+        buffer[0] = (self.version << 6) | (self.message_type << 4) | (len(token) & 0b1111)
+        buffer[1] = self.code
+        buffer[2] = (message_id >> 8) & 0xFF
+        buffer[3] = message_id & 0xFF
+
+        # CoAP Token
+        offset = CoapPacket.__write(buffer, 4, token)
+
+        # CoAP Options
+        prev_option_delta = 0
+        for delta, option_value in sorted(self.options.items()):
+            option_bytes = CoapPacket._encode_option(option_value, delta - prev_option_delta)
+            offset = CoapPacket.__write(buffer, offset, option_bytes)
+            prev_option_delta = delta
+
+        # CoAP Payload
+        return CoapPacket.__write(buffer, offset, self.__encode_payload())
+
+    @staticmethod
+    def __write(buffer, offset: int, data) -> int:
+        end = offset + len(data)
+        if end > len(buffer):
+            raise ValueError("The buffer is too small for the CoAP packet")
+        buffer[offset:end] = data
+        return end
+
+    def __encode_payload(self) -> bytes:
+        """
+        Returns the payload marker followed by the payload, encoded according to the content format option.
+        """
+        if not self.payload:
+            return PAYLOAD_MARKER
+
+        if CoapOptionDelta.CONTENT_FORMAT.value in self.options:
+            if self.options[CoapOptionDelta.CONTENT_FORMAT.value] == CoapContentFormat.TEXT_PLAIN_UTF8.value:
+                return PAYLOAD_MARKER + bytes(self.payload.encode(encoding="utf-8"))
+            elif self.options[CoapOptionDelta.CONTENT_FORMAT.value] == CoapContentFormat.APPLICATION_JSON.value:
+                if not isinstance(self.payload, str):
+                    self.payload = json.dumps(self.payload)
+                return PAYLOAD_MARKER + bytes(self.payload.encode(encoding="utf-8"))
+
+        return PAYLOAD_MARKER + bytes(self.payload)
+
     @classmethod
     def decode(cls, coap_packet, address: tuple, skt: socket):
+        """
+        Decode a byte representation of a CoAP packet into a new CoapPacket instance.
+
+        Args:
+            coap_packet (bytes): Byte representation of the CoAP packet.
+            address (tuple): Address of the sender.
+            skt (socket): Socket on which the packet was received.
+
+        Returns:
+            CoapPacket: Decoded CoapPacket instance.
+        """
+        return CoapPacket.decode_into(coap_packet, address, skt, cls())
+
+    @staticmethod
+    def decode_into(coap_packet, address: tuple, skt: socket, out: 'CoapPacket'):
         """
         Decode a byte representation of a CoAP packet.
 
-        This class method decodes a byte representation of a CoAP packet into a CoapPacket instance.
+        This method decodes a byte representation of a CoAP packet into an existing CoapPacket instance.
         It extracts information from source.the CoAP header, including the version, message type, token length,
         code, and message ID. The token is then retrieved from source.the byte representation, followed by the
         options, which are processed using the _interpret_option_value helper method. The payload, if present,
-        is also extracted. The decoded CoapPacket instance is then returned.
+        is also extracted. All the fields of the given instance are overwritten and the instance is returned.
 
         Args:
             coap_packet (bytes): Byte representation of the CoAP packet.
+            address (tuple): Address of the sender.
+            skt (socket): Socket on which the packet was received.
+            out (CoapPacket): Instance that receives the decoded fields, e.g. one taken from the CoapPacketPool.
 
         Returns:
-            CoapPacket: Decoded CoapPacket instance.
-            :param coap_packet:
-            :param address:
-            :param skt:
+            CoapPacket: The out instance.
         """
-        # Header
-        version = (coap_packet[0] >> 6) & 0b11
-        message_type = (coap_packet[0] >> 4) & 0b11
-        token_length = coap_packet[0] & 0b1111
-        code = coap_packet[1]
-        message_id = (coap_packet[2] << 8) | coap_packet[3]
-
-        # Token
-        token = coap_packet[4:4 + token_length]
+        # Header and token
+        header = parse_header(coap_packet)
+        if header is None:
+            raise ValueError("The datagram is too short to be a CoAP packet")
+        version, message_type, code, message_id, token, options_start = header
 
         # Options
-        options_start = 4 + len(token)
         options = {}
         prev_option_delta = 0
 
@@ -345,7 +458,8 @@ class CoapPacket:
                 payload = payload.decode("utf-8")
             elif options[CoapOptionDelta.CONTENT_FORMAT.value] == CoapContentFormat.APPLICATION_JSON.value:
                 payload = json.loads(payload)
-        return cls(version, message_type, token, code, message_id, options, payload, address, skt)
+        out.reset(version, message_type, token, code, message_id, options, payload, address, skt)
+        return out
 
     def __repr__(self):
         """
@@ -354,7 +468,7 @@ class CoapPacket:
         Returns:
             str: String representation of the CoAPPacket object.
         """
-        readable_options = deepcopy(self.options)
+        readable_options = self.options.copy()
         for option in readable_options.keys():
             if option == CoapOptionDelta.BLOCK2.value or option == CoapOptionDelta.BLOCK1.value:
                 readable_options[option] = CoapPacket.decode_option_block(readable_options[option])
@@ -0,0 +1,33 @@
+from queue import SimpleQueue, Empty
+
+from source.coap_core.coap_packet.coap_packet import CoapPacket
+from source.coap_core.coap_utilities.coap_singleton import CoapSingletonBase
+
+
+class CoapPacketPool(CoapSingletonBase):
+    """
+    Keeps CoapPacket instances around to be reused for the received datagrams,
+    so the decoding does not allocate a new packet for every datagram.
+
+    A packet must be released only by the last stage that uses it
+    (e.g. a dropped duplicate, or a worker after the task was solved).
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.__capacity = capacity
+        self.__packets = SimpleQueue()
+
+        for _ in range(capacity):
+            self.__packets.put(CoapPacket())
+
+    def acquire(self) -> CoapPacket:
+        try:
+            return self.__packets.get_nowait()
+        except Empty:
+            return CoapPacket()
+
+    def release(self, packet: CoapPacket):
+        if self.__packets.qsize() < self.__capacity:
+            # drop the references to the payload and options of the previous datagram
+            packet.reset()
+            self.__packets.put(packet)
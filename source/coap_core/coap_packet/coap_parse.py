@@ -0,0 +1,69 @@
+"""
+Header parsing and classification of the received CoAP datagrams.
+
+This module is written in the plain Python subset understood by Cython: setup.py compiles it into an
+extension when Cython is installed, and the interpreted module is used otherwise.
+
+Reference: https://datatracker.ietf.org/doc/html/rfc7252#section-3
+"""
+from source.coap_core.coap_packet.coap_config import CoapType, CoapCodeFormat
+
+# Tags returned by classify(); the CoapWorkerPool dispatches on them
+TAG_INVALID = 0
+TAG_CON = 1
+TAG_CON_CONTENT = 2
+TAG_NON = 3
+TAG_ACK = 4
+TAG_RST = 5
+
+_VALID_CODES = CoapCodeFormat._VALUES
+_CONTENT_CODE = CoapCodeFormat.SUCCESS_CONTENT.value()
+
+_TYPE_TAGS = {
+    CoapType.CON.value: TAG_CON,
+    CoapType.NON.value: TAG_NON,
+    CoapType.ACK.value: TAG_ACK,
+    CoapType.RST.value: TAG_RST,
+}
+
+
+def parse_header(data: bytes):
+    """
+    Parse the fixed header and the token of a CoAP datagram.
+
+    Args:
+        data (bytes): The datagram.
+
+    Returns:
+        tuple: (version, message_type, code, message_id, token, options_offset),
+               or None when the datagram is too short to hold them.
+    """
+    length = len(data)
+    if length < 4:
+        return None
+
+    first = data[0]
+    token_length = first & 0b1111
+    options_offset = 4 + token_length
+    if options_offset > length:
+        return None
+
+    return ((first >> 6) & 0b11, (first >> 4) & 0b11, data[1], (data[2] << 8) | data[3],
+            bytes(data[4:options_offset]), options_offset)
+
+
+def classify(version: int, message_type: int, code: int) -> int:
+    """
+    Check the header fields of a packet and tell how it must be handled.
+
+    Returns:
+        int: TAG_INVALID when the version, type or code is not valid, otherwise the tag of the message type
+             (TAG_CON_CONTENT for a confirmable content response).
+    """
+    if version != 1 or code not in _VALID_CODES:
+        return TAG_INVALID
+
+    tag = _TYPE_TAGS.get(message_type, TAG_INVALID)
+    if tag == TAG_CON and code == _CONTENT_CODE:
+        return TAG_CON_CONTENT
+    return tag
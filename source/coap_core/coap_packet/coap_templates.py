@@ -1,4 +1,3 @@
-from copy import deepcopy
 from enum import Enum
 
 from source.coap_core.coap_packet.coap_config import CoapType, CoapCodeFormat, CoapContentFormat, CoapOptionDelta
@@ -197,10 +196,22 @@ class CoapTemplates(Enum):
         self.coap_packet = coap_packet
 
     def value_with(self, tkn, msg_id) -> CoapPacket:
-        request = deepcopy(self.coap_packet)
+        request = self.coap_packet.clone()
         request.token = tkn
         request.message_id = msg_id % 65536
         return request
 
+    def value_into(self, out: CoapPacket, tkn, msg_id) -> CoapPacket:
+        """
+        Overwrite a scratch packet with this template, instead of allocating a copy of it.
+        """
+        template = self.coap_packet
+        options = out.options
+        options.clear()
+        options.update(template.options)
+        out.reset(template.version, template.message_type, tkn, template.code, msg_id % 65536, options,
+                  template.payload)
+        return out
+
     def value(self) -> CoapPacket:
-        return deepcopy(self.coap_packet)
+        return self.coap_packet.clone()
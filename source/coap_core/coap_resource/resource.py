@@ -5,6 +5,13 @@ from source.coap_core.coap_packet.coap_packet import CoapPacket
 
 
 class Resource(ABC):
+    """
+    Base class of the resources the CoapWorker hands the received requests to.
+
+    A received request is returned to the CoapPacketPool as soon as its handler returns, and the instance is
+    reset and reused for another datagram. Handlers must not keep a reference to the request afterwards: a
+    handler that defers work (another thread, a stored callback, ...) must pass it request.clone() instead.
+    """
 
     def __init__(self, name: str):
         self.__name = name
@@ -6,11 +6,17 @@ from source.coap_core.coap_packet.coap_packet import CoapPacket
 from source.coap_core.coap_transaction.coap_transaction import CoapTransaction
 from source.coap_core.coap_utilities.coap_timer import CoapTimer
 
+# the timestamps only mark when a transaction finished or failed
+_now_ns = time.monotonic_ns
+
 
 class CoapTransactionPool(CoapSingletonBase):
     SUCCESSFULLY_ADDED = 1
     FAIL_TO_ADD = 2
 
+    # seconds between two checks of the pending transactions, well below CoapTransaction.ACK_TIMEOUT
+    SOLVE_INTERVAL = 0.1
+
     def __init__(self):
         self.__is_running = True
 
@@ -20,6 +26,9 @@ class CoapTransactionPool(CoapSingletonBase):
         self.__transaction_dict: dict[tuple, CoapTransaction] = {}
         self.__retransmissions: dict = {}
 
+        # set when a transaction is added; cleared by the waiting thread before it checks the pool
+        self.__transactions_added = threading.Event()
+
     def handle_congestions(self, packet: CoapPacket, last_packet: bool = False):
         if self.is_overall_transaction_failed(packet):
             return True
@@ -45,6 +54,24 @@ class CoapTransactionPool(CoapSingletonBase):
         # than the moment when the transaction is added to the pool.
         if key not in self.__finished_transactions:
             self.__transaction_dict[key] = transaction
+            if not self.__transactions_added.is_set():
+                self.__transactions_added.set()
+
+    def wait_for_transactions(self, timeout: float) -> bool:
+        """
+        Block until there is a pending transaction.
+
+        Returns:
+            bool: False when the timeout expired and there is still no transaction.
+        """
+        if self.__transaction_dict:
+            return True
+
+        # cleared before the last check, so a signal for a transaction already gone cannot wake the thread
+        self.__transactions_added.clear()
+        if self.__transaction_dict:
+            return True
+        return self.__transactions_added.wait(timeout) and bool(self.__transaction_dict)
 
     def is_transaction_finished(self, packet: CoapPacket):
         key = packet.short_term_work_id(packet.get_block_id())
@@ -85,14 +112,14 @@ class CoapTransactionPool(CoapSingletonBase):
         else:
             key = packet.short_term_work_id(int(packet.payload))
 
-        self.__finished_transactions[key] = time.time()
+        self.__finished_transactions[key] = _now_ns()
 
         # there is no need to delete the transaction if it has already finished.
         if key in self.__transaction_dict:
             del self.__transaction_dict[key]
 
     def finish_overall_transaction(self, packet: CoapPacket):
-        self.__overall_finished_transactions[packet.general_work_id()] = time.time()
+        self.__overall_finished_transactions[packet.general_work_id()] = _now_ns()
 
     def wait_util_finish(self, packet: CoapPacket):
         while packet.general_work_id() not in self.__overall_finished_transactions:
@@ -102,7 +129,7 @@ class CoapTransactionPool(CoapSingletonBase):
         return packet.general_work_id() in self.__failed_transactions
 
     def set_overall_transaction_failure(self, packet: CoapPacket):
-        self.__failed_transactions[packet.general_work_id()] = time.time()
+        self.__failed_transactions[packet.general_work_id()] = _now_ns()
 
     def get_number_of_retransmissions(self, packet: CoapPacket):
         general_id = packet.general_work_id()
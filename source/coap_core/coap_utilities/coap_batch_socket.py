@@ -0,0 +1,273 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+from functools import lru_cache
+from socket import socket, inet_ntop, inet_pton, AF_INET, AF_INET6, SOL_SOCKET, SO_RCVTIMEO
+
+from source.coap_core.coap_utilities.coap_logger import logger
+
+MSG_WAITFORONE = 0x10000
+SOCKADDR_STORAGE_SIZE = 128
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", _MsgHdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "recvmmsg") or not hasattr(libc, "sendmmsg"):
+        return None
+
+    libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    libc.recvmmsg.restype = ctypes.c_int
+    libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    libc.sendmmsg.restype = ctypes.c_int
+    return libc
+
+
+_libc = _load_libc()
+
+
+def set_receive_timeout(skt: socket, seconds: float):
+    """
+    Set SO_RCVTIMEO on a blocking socket, so a blocked receive gives up after the given amount of time.
+
+    Unlike socket.settimeout, the file descriptor stays blocking and no extra poll() is issued per receive.
+    """
+    if sys.platform == "win32":
+        # a DWORD of milliseconds instead of a struct timeval
+        skt.setsockopt(SOL_SOCKET, SO_RCVTIMEO, struct.pack("L", int(seconds * 1000)))
+        return
+
+    whole = int(seconds)
+    skt.setsockopt(SOL_SOCKET, SO_RCVTIMEO, struct.pack("ll", whole, int((seconds - whole) * 1_000_000)))
+
+
+def decode_sockaddr(raw: bytes) -> tuple:
+    """
+    Convert a raw sockaddr_in/sockaddr_in6 into the address tuple returned by socket.recvfrom.
+    """
+    family = int.from_bytes(raw[0:2], sys.byteorder)
+    port = int.from_bytes(raw[2:4], 'big')
+    if family == AF_INET6:
+        return inet_ntop(AF_INET6, raw[8:24]), port, int.from_bytes(raw[4:8], 'big'), \
+            int.from_bytes(raw[24:28], sys.byteorder)
+    return inet_ntop(AF_INET, raw[4:8]), port
+
+
+@lru_cache(maxsize=1024)
+def encode_sockaddr(address: tuple) -> bytes:
+    """
+    Convert an address tuple, as accepted by socket.sendto, into a raw sockaddr_in/sockaddr_in6.
+    """
+    if len(address) == 4:
+        return (AF_INET6.to_bytes(2, sys.byteorder) + address[1].to_bytes(2, 'big') + address[2].to_bytes(4, 'big')
+                + inet_pton(AF_INET6, address[0]) + address[3].to_bytes(4, sys.byteorder))
+    return AF_INET.to_bytes(2, sys.byteorder) + address[1].to_bytes(2, 'big') + inet_pton(AF_INET, address[0]) \
+        + bytes(8)
+
+
+class CoapBatchReceiver:
+    """
+    Receives up to batch_size datagrams per system call using Linux recvmmsg(2).
+
+    All the message headers, io vectors, address slots and data buffers are allocated once,
+    so the receive path only has to refill the address lengths before every call.
+    The socket must be blocking; use set_receive_timeout to bound the wait for the first datagram.
+
+    Reference: https://man7.org/linux/man-pages/man2/recvmmsg.2.html
+    """
+
+    @staticmethod
+    def is_supported() -> bool:
+        return _libc is not None
+
+    def __init__(self, skt: socket, batch_size: int = 32, buffer_size: int = 1152):
+        if not CoapBatchReceiver.is_supported():
+            raise OSError(errno.ENOSYS, "recvmmsg is not available on this platform")
+
+        self.__fd = skt.fileno()
+        self.__batch_size = batch_size
+
+        self.__buffers = [ctypes.create_string_buffer(buffer_size) for _ in range(batch_size)]
+        self.__addresses = [ctypes.create_string_buffer(SOCKADDR_STORAGE_SIZE) for _ in range(batch_size)]
+        self.__iovecs = (_IoVec * batch_size)()
+        self.__messages = (_MMsgHdr * batch_size)()
+
+        for index in range(batch_size):
+            self.__iovecs[index].iov_base = ctypes.addressof(self.__buffers[index])
+            self.__iovecs[index].iov_len = buffer_size
+
+            header = self.__messages[index].msg_hdr
+            header.msg_name = ctypes.addressof(self.__addresses[index])
+            header.msg_namelen = SOCKADDR_STORAGE_SIZE
+            header.msg_iov = ctypes.pointer(self.__iovecs[index])
+            header.msg_iovlen = 1
+
+    def receive(self) -> list[tuple[bytes, tuple]]:
+        """
+        Block until at least one datagram is available, then take every queued datagram (up to batch_size).
+
+        Returns:
+            list[tuple[bytes, tuple]]: (data, address) pairs, empty when the receive timeout expired.
+        """
+        messages = self.__messages
+        for index in range(self.__batch_size):
+            messages[index].msg_hdr.msg_namelen = SOCKADDR_STORAGE_SIZE
+
+        count = _libc.recvmmsg(self.__fd, messages, self.__batch_size, MSG_WAITFORONE, None)
+        if count < 0:
+            error = ctypes.get_errno()
+            if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(error, os.strerror(error))
+
+        received = []
+        for index in range(count):
+            header = messages[index].msg_hdr
+            data = ctypes.string_at(self.__buffers[index], messages[index].msg_len)
+            address = decode_sockaddr(ctypes.string_at(self.__addresses[index], header.msg_namelen))
+            received.append((data, address))
+
+        return received
+
+    def close(self):
+        """
+        Nothing to release: the buffers are owned by the receiver and the socket by its creator.
+        """
+        pass
+
+
+class CoapBatchSender:
+    """
+    Collects outgoing datagrams and sends them with a single Linux sendmmsg(2) call.
+
+    The packets are encoded into preallocated slots; flush() sends every pending slot. The batch is
+    flushed automatically when it is full. On platforms without sendmmsg every datagram is sent right away.
+
+    Reference: https://man7.org/linux/man-pages/man2/sendmmsg.2.html
+    """
+
+    @staticmethod
+    def is_supported() -> bool:
+        return _libc is not None
+
+    def __init__(self, skt: socket, batch_size: int = 32, buffer_size: int = 1152):
+        self.__socket = skt
+        self.__batch_size = batch_size
+        self.__buffer_size = buffer_size
+        self.__pending = 0
+
+        if not CoapBatchSender.is_supported():
+            # encode_into() target of add_packet() when the datagrams are sent right away
+            self.__scratch = memoryview(bytearray(buffer_size))
+            return
+
+        self.__fd = skt.fileno()
+        self.__buffers = [ctypes.create_string_buffer(buffer_size) for _ in range(batch_size)]
+        self.__addresses = [ctypes.create_string_buffer(SOCKADDR_STORAGE_SIZE) for _ in range(batch_size)]
+        self.__iovecs = (_IoVec * batch_size)()
+        self.__messages = (_MMsgHdr * batch_size)()
+        self.__views = [memoryview(buffer).cast("B") for buffer in self.__buffers]
+
+        for index in range(batch_size):
+            self.__iovecs[index].iov_base = ctypes.addressof(self.__buffers[index])
+
+            header = self.__messages[index].msg_hdr
+            header.msg_name = ctypes.addressof(self.__addresses[index])
+            header.msg_iov = ctypes.pointer(self.__iovecs[index])
+            header.msg_iovlen = 1
+
+    def add_packet(self, packet, address: tuple):
+        """
+        Queue a packet, encoded with its encode_into() method straight into the next slot, so no
+        intermediate bytes object is built. The batch is flushed first when it is full.
+        """
+        try:
+            if not CoapBatchSender.is_supported():
+                length = packet.encode_into(self.__scratch)
+                self.__send(self.__scratch[:length], address)
+                return
+
+            if self.__pending == self.__batch_size:
+                self.flush()
+
+            length = packet.encode_into(self.__views[self.__pending])
+        except ValueError:
+            # larger than a slot: sent on its own, after the replies queued before it
+            self.flush()
+            self.__send(packet.encode(), address)
+            return
+
+        self.__commit(length, address)
+
+    def __commit(self, length: int, address: tuple):
+        """
+        Complete the next slot, whose buffer holds a datagram of the given length, and mark it pending.
+        """
+        index = self.__pending
+        raw_address = encode_sockaddr(address)
+        ctypes.memmove(self.__addresses[index], raw_address, len(raw_address))
+        self.__iovecs[index].iov_len = length
+        self.__messages[index].msg_hdr.msg_namelen = len(raw_address)
+
+        self.__pending += 1
+
+    def flush(self):
+        """
+        Send every pending datagram; the ones the kernel did not take at once are retried.
+
+        A datagram that cannot be sent is logged and dropped, the others are still sent: like with
+        sendto, an error only affects its own reply.
+        """
+        sent = 0
+        while sent < self.__pending:
+            count = _libc.sendmmsg(self.__fd, ctypes.byref(self.__messages, sent * ctypes.sizeof(_MMsgHdr)),
+                                   self.__pending - sent, 0)
+            if count < 0:
+                error = ctypes.get_errno()
+                if error == errno.EINTR:
+                    continue
+                # sendmmsg fails only when its first datagram could not be sent
+                logger.debug(f"Failed to send a datagram: {os.strerror(error)}")
+                count = 1
+            sent += count
+
+        self.__pending = 0
+
+    def __send(self, data, address: tuple):
+        try:
+            self.__socket.sendto(data, address)
+        except OSError as e:
+            logger.debug(f"Failed to send a datagram to {address}: {e}")
@@ -0,0 +1,51 @@
+import threading
+import time
+from itertools import islice
+
+
+class CoapDedupTable:
+    """
+        Class specially tailored for CoapWorkerPool
+
+        Bounded set of the work ids in progress, used to drop duplicated requests.
+        Work ids are the keys of a dictionary, next to their monotonic_ns() timestamp, so a lookup is a single
+        dictionary hit. The dictionary keeps the insertion order: when it grows past capacity entries the oldest
+        half is evicted, so the memory used stays bounded; entries older than the ttl are cleared by sweep().
+        Lookups take no lock, the changes are serialized.
+    """
+
+    def __init__(self, capacity: int = 2 ** 17, ttl: float = 247):
+        """
+        Args:
+            capacity (int): Maximum number of entries.
+            ttl (float): Seconds after which an entry is dropped by sweep() (EXCHANGE_LIFETIME by default).
+        """
+        self.__capacity = capacity
+        self.__ttl = int(ttl * 1_000_000_000)
+        self.__entries: dict[tuple, int] = {}
+        self.__lock = threading.Lock()
+
+    def __contains__(self, work_id) -> bool:
+        return work_id in self.__entries
+
+    def add(self, work_id):
+        with self.__lock:
+            entries = self.__entries
+            entries[work_id] = time.monotonic_ns()
+            if len(entries) > self.__capacity:
+                # rebuilt rather than deleted from the front, which leaves the dictionary full of dummy slots
+                self.__entries = dict(islice(entries.items(), len(entries) // 2, None))
+
+    def remove(self, work_id):
+        with self.__lock:
+            self.__entries.pop(work_id, None)
+
+    def sweep(self):
+        """
+        Drop the entries older than the ttl.
+        """
+        expired = time.monotonic_ns() - self.__ttl
+        with self.__lock:
+            self.__entries = {
+                work_id: timestamp for work_id, timestamp in self.__entries.items() if timestamp >= expired
+            }
@@ -1,26 +1,75 @@
-from threading import Event, Thread
-from time import sleep
+from collections import deque
+from threading import Event
 
 
 class CoapQueue:
     """
         Class specially tailored for CoapWorkerPool
+
+        Queue without a lock on the data path: deque.append and deque.popleft are atomic, so put()
+        is an append plus an attribute read while the consumer keeps up, and the event is only touched
+        to wake up a consumer waiting on an empty queue. Any thread may put; only the owner waits in
+        get(), other threads may take items through steal_half().
     """
 
     def __init__(self):
-        self.__list = []
+        self.__items = deque()
         self.__event = Event()
 
     def put(self, data):
-        self.__event.set()
-        self.__list.append(data)
+        self.__items.append(data)
+        # The consumer clears the event before its last look at the deque, so a set event
+        # means it will still see this item without being woken up
+        if not self.__event.is_set():
+            self.__event.set()
+
+    def get(self, timeout: float = None):
+        """
+        Remove and return the oldest item, waiting for one if the queue is empty.
+
+        Returns None when the timeout expires before an item is available.
+        """
+        items = self.__items
+        while True:
+            try:
+                return items.popleft()
+            except IndexError:
+                pass
 
-    def get(self):
-        self.__event.wait()
-        data = self.__list.pop(0)
-        if len(self.__list) == 0:
             self.__event.clear()
-        return data
+            try:
+                return items.popleft()
+            except IndexError:
+                pass
+
+            if not self.__event.wait(timeout):
+                return None
+
+    def put_all(self, items: list):
+        self.__items.extend(items)
+        if not self.__event.is_set():
+            self.__event.set()
+
+    def steal_half(self) -> list:
+        """
+        Remove and return the oldest half of the items, for another consumer to work on.
+        """
+        stolen = []
+        for _ in range(len(self.__items) // 2):
+            try:
+                stolen.append(self.__items.popleft())
+            except IndexError:
+                break
+        return stolen
+
+    def get_nowait(self):
+        """
+        Remove and return the oldest item, or None if the queue is empty.
+        """
+        try:
+            return self.__items.popleft()
+        except IndexError:
+            return None
 
     def size(self):
-        return len(self.__list)
+        return len(self.__items)
@@ -0,0 +1,319 @@
+import ctypes
+import errno
+import mmap
+import os
+import struct
+import sys
+from socket import socket
+
+from source.coap_core.coap_utilities.coap_batch_socket import _MsgHdr, decode_sockaddr, SOCKADDR_STORAGE_SIZE
+from source.coap_core.coap_utilities.coap_logger import logger
+
+# Reference: include/uapi/linux/io_uring.h
+SYS_IO_URING_SETUP = 425
+SYS_IO_URING_ENTER = 426
+SYS_IO_URING_REGISTER = 427
+
+IORING_OFF_SQ_RING = 0
+IORING_OFF_CQ_RING = 0x8000000
+IORING_OFF_SQES = 0x10000000
+
+IORING_SETUP_CQSIZE = 1 << 3
+
+IORING_FEAT_SINGLE_MMAP = 1 << 0
+IORING_FEAT_EXT_ARG = 1 << 8
+
+IORING_ENTER_GETEVENTS = 1 << 0
+IORING_ENTER_EXT_ARG = 1 << 3
+
+IORING_REGISTER_PBUF_RING = 22
+
+IORING_OP_RECVMSG = 10
+IOSQE_BUFFER_SELECT = 1 << 5
+IORING_RECV_MULTISHOT = 1 << 1
+
+IORING_CQE_F_MORE = 1 << 1
+IORING_CQE_BUFFER_SHIFT = 16
+
+SQE_SIZE = 64
+CQE_SIZE = 16
+RECVMSG_OUT_SIZE = 16
+
+
+class _SqRingOffsets(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_uint32) for name in
+                ("head", "tail", "ring_mask", "ring_entries", "flags", "dropped", "array", "resv1")] + \
+               [("user_addr", ctypes.c_uint64)]
+
+
+class _CqRingOffsets(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_uint32) for name in
+                ("head", "tail", "ring_mask", "ring_entries", "overflow", "cqes", "flags", "resv1")] + \
+               [("user_addr", ctypes.c_uint64)]
+
+
+class _Params(ctypes.Structure):
+    _fields_ = [
+        ("sq_entries", ctypes.c_uint32),
+        ("cq_entries", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("sq_thread_cpu", ctypes.c_uint32),
+        ("sq_thread_idle", ctypes.c_uint32),
+        ("features", ctypes.c_uint32),
+        ("wq_fd", ctypes.c_uint32),
+        ("resv", ctypes.c_uint32 * 3),
+        ("sq_off", _SqRingOffsets),
+        ("cq_off", _CqRingOffsets),
+    ]
+
+
+class _BufReg(ctypes.Structure):
+    _fields_ = [
+        ("ring_addr", ctypes.c_uint64),
+        ("ring_entries", ctypes.c_uint32),
+        ("bgid", ctypes.c_uint16),
+        ("flags", ctypes.c_uint16),
+        ("resv", ctypes.c_uint64 * 3),
+    ]
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [
+        ("tv_sec", ctypes.c_int64),
+        ("tv_nsec", ctypes.c_int64),
+    ]
+
+
+class _GeteventsArg(ctypes.Structure):
+    _fields_ = [
+        ("sigmask", ctypes.c_uint64),
+        ("sigmask_sz", ctypes.c_uint32),
+        ("min_wait_usec", ctypes.c_uint32),
+        ("ts", ctypes.c_uint64),
+    ]
+
+
+def _kernel_at_least(major: int, minor: int) -> bool:
+    try:
+        version = os.uname().release.split("-")[0].split(".")
+        return (int(version[0]), int(version[1])) >= (major, minor)
+    except (ValueError, IndexError):
+        return False
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux") or not _kernel_at_least(6, 0):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+    libc.syscall.restype = ctypes.c_long
+    return libc
+
+
+_libc = _load_libc()
+
+
+def _syscall(number: int, *args) -> int:
+    # syscall(2) is variadic: every integer argument must be widened to a full register
+    return _libc.syscall(ctypes.c_long(number), *(ctypes.c_long(arg) if isinstance(arg, int) else arg for arg in args))
+
+
+def _address_of(buffer: mmap.mmap) -> int:
+    return ctypes.addressof(ctypes.c_char.from_buffer(buffer))
+
+
+class CoapUringReceiver:
+    """
+    Receives datagrams through a single io_uring multishot recvmsg request.
+
+    One submission stays armed for as long as the kernel can post completions: every datagram is written
+    by the kernel into a buffer picked from a registered buffer ring, so the steady state has neither a
+    receive system call per packet nor a per-packet allocation on the kernel side. The ring is only entered
+    to wait for completions, and each wait collects every completion that is already posted.
+
+    Multishot recvmsg requires Linux 6.0; older kernels must use CoapBatchReceiver instead.
+
+    Reference: https://man7.org/linux/man-pages/man3/io_uring_prep_recvmsg_multishot.3.html
+    """
+
+    @staticmethod
+    def is_supported() -> bool:
+        return _libc is not None
+
+    def __init__(self, skt: socket, entries: int = 1024, buffer_size: int = 2048, timeout: float = 1):
+        """
+        Args:
+            skt (socket): Bound UDP socket to receive from.
+            entries (int): Number of provided buffers, must be a power of 2.
+            buffer_size (int): Size of a provided buffer; it holds the recvmsg header, the address and the datagram.
+            timeout (float): Maximum time in seconds that receive() waits for a datagram.
+        """
+        if not CoapUringReceiver.is_supported():
+            raise OSError(errno.ENOSYS, "io_uring multishot recvmsg is not available on this platform")
+
+        self.__socket_fd = skt.fileno()
+        self.__entries = entries
+        self.__buffer_size = buffer_size
+        self.__payload_offset = RECVMSG_OUT_SIZE + SOCKADDR_STORAGE_SIZE
+        self.__armed = False
+
+        # a completion queue as large as the buffer ring, so a burst filling every buffer does not
+        # overflow it and terminate the multishot request
+        params = _Params()
+        params.flags = IORING_SETUP_CQSIZE
+        params.cq_entries = entries
+        self.__ring_fd = _syscall(SYS_IO_URING_SETUP, 8, ctypes.byref(params))
+        if self.__ring_fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+        try:
+            if not params.features & IORING_FEAT_EXT_ARG:
+                raise OSError(errno.ENOSYS, "io_uring does not support waiting with a timeout")
+
+            sq_size = params.sq_off.array + params.sq_entries * 4
+            cq_size = params.cq_off.cqes + params.cq_entries * CQE_SIZE
+            if params.features & IORING_FEAT_SINGLE_MMAP:
+                sq_size = cq_size = max(sq_size, cq_size)
+
+            self.__sq_ring = self.__map_ring(sq_size, IORING_OFF_SQ_RING)
+            if params.features & IORING_FEAT_SINGLE_MMAP:
+                self.__cq_ring = self.__sq_ring
+            else:
+                self.__cq_ring = self.__map_ring(cq_size, IORING_OFF_CQ_RING)
+            self.__sqes = self.__map_ring(params.sq_entries * SQE_SIZE, IORING_OFF_SQES)
+
+            self.__sq_off = params.sq_off
+            self.__sq_mask = ctypes.c_uint32.from_buffer(self.__sq_ring, params.sq_off.ring_mask).value
+            self.__sq_tail = ctypes.c_uint32.from_buffer(self.__sq_ring, params.sq_off.tail)
+
+            self.__cq_off = params.cq_off
+            self.__cq_mask = ctypes.c_uint32.from_buffer(self.__cq_ring, params.cq_off.ring_mask).value
+            self.__cq_head = ctypes.c_uint32.from_buffer(self.__cq_ring, params.cq_off.head)
+            self.__cq_tail = ctypes.c_uint32.from_buffer(self.__cq_ring, params.cq_off.tail)
+
+            self.__setup_buffer_ring()
+
+            # The message header only describes the layout of the provided buffers (address slot, no control data)
+            self.__message = _MsgHdr()
+            self.__message.msg_namelen = SOCKADDR_STORAGE_SIZE
+
+            self.__timespec = _Timespec(int(timeout), int((timeout - int(timeout)) * 1_000_000_000))
+            self.__wait_arg = _GeteventsArg(ts=ctypes.addressof(self.__timespec))
+        except OSError:
+            os.close(self.__ring_fd)
+            raise
+
+    def __map_ring(self, size: int, offset: int) -> mmap.mmap:
+        return mmap.mmap(self.__ring_fd, size, flags=mmap.MAP_SHARED | mmap.MAP_POPULATE,
+                         prot=mmap.PROT_READ | mmap.PROT_WRITE, offset=offset)
+
+    def __setup_buffer_ring(self):
+        """
+        Register the provided buffers ring (buffer group 0) and hand every buffer to the kernel.
+        """
+        self.__buffer_ring = mmap.mmap(-1, self.__entries * 16)
+        self.__buffers = mmap.mmap(-1, self.__entries * self.__buffer_size)
+        self.__buffers_address = _address_of(self.__buffers)
+
+        registration = _BufReg(ring_addr=_address_of(self.__buffer_ring), ring_entries=self.__entries, bgid=0)
+        if _syscall(SYS_IO_URING_REGISTER, self.__ring_fd, IORING_REGISTER_PBUF_RING,
+                    ctypes.byref(registration), 1) < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+        # the tail shares its position with the reserved field of the first entry
+        self.__buffer_ring_tail = ctypes.c_uint16.from_buffer(self.__buffer_ring, 14)
+        self.__buffer_ring_mask = self.__entries - 1
+
+        for buffer_id in range(self.__entries):
+            self.__recycle_buffer(buffer_id, buffer_id)
+        self.__buffer_ring_tail.value += self.__entries
+
+    def __recycle_buffer(self, buffer_id: int, offset: int):
+        index = (self.__buffer_ring_tail.value + offset) & self.__buffer_ring_mask
+        struct.pack_into("QIH", self.__buffer_ring, index * 16,
+                         self.__buffers_address + buffer_id * self.__buffer_size, self.__buffer_size, buffer_id)
+
+    def __arm(self):
+        """
+        Queue the multishot recvmsg request; it is submitted with the next wait.
+        """
+        struct.pack_into("BBHiQQIIQHHiQQ", self.__sqes, 0,
+                         IORING_OP_RECVMSG, IOSQE_BUFFER_SELECT, IORING_RECV_MULTISHOT, self.__socket_fd,
+                         0, ctypes.addressof(self.__message), 1, 0, 0, 0, 0, 0, 0, 0)
+
+        tail = self.__sq_tail.value
+        struct.pack_into("I", self.__sq_ring, self.__sq_off.array + (tail & self.__sq_mask) * 4, 0)
+        self.__sq_tail.value = (tail + 1) & 0xFFFFFFFF
+        self.__armed = True
+
+    def receive(self) -> list[tuple[bytes, tuple]]:
+        """
+        Wait until at least one completion is posted, then collect every posted datagram.
+
+        The data is copied out of the provided buffers, which go back to the kernel right away.
+        Failed completions are logged and skipped; the request is re-armed if they terminated it.
+
+        Returns:
+            list[tuple[bytes, tuple]]: (data, address) pairs, empty when the timeout expired.
+        """
+        to_submit = 0
+        if not self.__armed:
+            self.__arm()
+            to_submit = 1
+
+        if self.__cq_head.value == self.__cq_tail.value:
+            result = _syscall(SYS_IO_URING_ENTER, self.__ring_fd, to_submit, 1,
+                              IORING_ENTER_GETEVENTS | IORING_ENTER_EXT_ARG,
+                              ctypes.byref(self.__wait_arg), ctypes.sizeof(self.__wait_arg))
+            if result < 0:
+                error = ctypes.get_errno()
+                if error not in (errno.ETIME, errno.EINTR, errno.EAGAIN, errno.EBUSY):
+                    raise OSError(error, os.strerror(error))
+
+        received = []
+        recycled = 0
+        head = self.__cq_head.value
+        tail = self.__cq_tail.value
+
+        while head != tail:
+            _, result, flags = struct.unpack_from("QiI", self.__cq_ring,
+                                                  self.__cq_off.cqes + (head & self.__cq_mask) * CQE_SIZE)
+            head = (head + 1) & 0xFFFFFFFF
+
+            if not flags & IORING_CQE_F_MORE:
+                # the request was terminated (e.g. no buffer left), it is re-armed on the next call
+                self.__armed = False
+
+            if result < 0:
+                # an error completion holds no buffer; the datagrams and buffers of this pass are kept
+                if -result not in (errno.ENOBUFS, errno.EINTR):
+                    logger.debug(f"io_uring recvmsg failed: {os.strerror(-result)}")
+                continue
+
+            buffer_id = flags >> IORING_CQE_BUFFER_SHIFT
+            start = buffer_id * self.__buffer_size
+            name_length = struct.unpack_from("I", self.__buffers, start)[0]
+
+            address = decode_sockaddr(self.__buffers[start + RECVMSG_OUT_SIZE:
+                                                     start + RECVMSG_OUT_SIZE + name_length])
+            data = self.__buffers[start + self.__payload_offset:start + result]
+            received.append((data, address))
+
+            self.__recycle_buffer(buffer_id, recycled)
+            recycled += 1
+
+        self.__cq_head.value = head
+        if recycled:
+            self.__buffer_ring_tail.value += recycled
+
+        return received
+
+    def close(self):
+        """
+        Release the ring; the pending multishot request is cancelled by the kernel.
+        """
+        os.close(self.__ring_fd)
@@ -1,45 +1,69 @@
+import time
 from contextlib import contextmanager
-from queue import Queue
 from threading import Thread
 
 from source.coap_core.coap_packet.coap_config import CoapOptionDelta, CoapCodeFormat
 from source.coap_core.coap_packet.coap_packet import CoapPacket
+from source.coap_core.coap_packet.coap_packet_pool import CoapPacketPool
 from source.coap_core.coap_packet.coap_templates import CoapTemplates
 from source.coap_core.coap_resource.resource_manager import ResourceManager
 from source.coap_core.coap_utilities.coap_queue import CoapQueue
 from source.coap_core.coap_utilities.coap_logger import logger
-from source.coap_core.coap_utilities.coap_timer import CoapTimer
 from source.share_drive_helpers.file_handler import FileHandler
 
 
 class CoapWorker(Thread, ):
+    # how long an idle worker waits on its own queue before trying to steal work from another worker;
+    # the wait doubles after every failed steal, up to MAX_STEAL_INTERVAL, so idle workers rarely wake up
+    STEAL_INTERVAL = 0.1
+    MAX_STEAL_INTERVAL = 5.0
+
     def __init__(self, owner):
         super().__init__()
 
         self.__is_running = True
 
-        self._request_queue = Queue()
+        self._request_queue = CoapQueue()
         self._task = CoapPacket()
         self._owner = owner
+        self._packet_pool = CoapPacketPool()
         self._heavy_work = False
 
-        self._timer = CoapTimer()
-        self._timer.reset()
+        self._last_active_ns = time.monotonic_ns()
+        self._idle_reported = False
 
     def get_queue_size(self):
-        return self._request_queue.qsize()
+        return self._request_queue.size()
 
-    def get_idle_time(self):
-        return self._timer.elapsed_time()
+    def get_idle_time(self) -> int:
+        """
+        Nanoseconds since the worker last started a task.
+        """
+        return time.monotonic_ns() - self._last_active_ns
 
     # @logger
     def run(self):
+        steal_interval = CoapWorker.STEAL_INTERVAL
         while self.__is_running:
-            task: CoapPacket = self._request_queue.get()
+            task: CoapPacket = self._request_queue.get(timeout=steal_interval)
             if not self.__is_running:
                 break
 
-            self._timer.reset()
+            if task is None:
+                if self.__steal_work():
+                    steal_interval = CoapWorker.STEAL_INTERVAL
+                else:
+                    steal_interval = min(steal_interval * 2, CoapWorker.MAX_STEAL_INTERVAL)
+                self.__report_idleness()
+                continue
+
+            steal_interval = CoapWorker.STEAL_INTERVAL
+
+            if task.is_dummy:
+                continue
+
+            self._last_active_ns = time.monotonic_ns()
+            self._idle_reported = False
 
             self._solve_task(task)
 
@@ -50,6 +74,33 @@ class CoapWorker(Thread, ):
                 task.long_term_work_id()
             )
 
+            # received packets go back to the pool, internal tasks are still referenced by their creator
+            if not task.needs_internal_computation:
+                self._packet_pool.release(task)
+
+    def __report_idleness(self):
+        """
+        Tell the owner, once per idle period, that this worker has been idle for longer than allowed.
+        """
+        if not self._idle_reported and self.get_idle_time() > self._owner.get_allowed_idle_time():
+            self._idle_reported = True
+            self._owner.report_idle_worker()
+
+    def __steal_work(self) -> bool:
+        """
+        Move the oldest half of a random busy worker's queue into this worker's queue.
+
+        Returns:
+            bool: True when some work was stolen.
+        """
+        victim = self._owner.choose_victim(self)
+        if victim:
+            stolen = victim._request_queue.steal_half()
+            if stolen:
+                self._request_queue.put_all(stolen)
+                return True
+        return False
+
     # @logger
     def stop(self):
         self.__is_running = False
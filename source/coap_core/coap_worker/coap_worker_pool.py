@@ -1,205 +1,407 @@
+import heapq
+import itertools
+import random
+import struct
 import sys
 import threading
 
+import _socket
 import socket
 import time
 from _socket import *
-from abc import ABC
-from queue import Queue
-from select import select
 from socket import socket, AF_INET, SOCK_DGRAM
 
 from source.coap_core.coap_worker.coap_worker import CoapWorker
-from source.coap_core.coap_packet.coap_config import CoapType, CoapCodeFormat, CoapOptionDelta
+from source.coap_core.coap_packet import coap_parse
+from source.coap_core.coap_packet.coap_config import CoapCodeFormat, CoapOptionDelta
+from source.coap_core.coap_packet.coap_packet_pool import CoapPacketPool
 from source.coap_core.coap_packet.coap_templates import CoapTemplates
 from source.coap_core.coap_transaction.coap_transaction_pool import CoapTransactionPool
+from source.coap_core.coap_utilities.coap_dedup_table import CoapDedupTable
+from source.coap_core.coap_utilities.coap_batch_socket import CoapBatchReceiver, CoapBatchSender, set_receive_timeout
+from source.coap_core.coap_utilities.coap_uring_receiver import CoapUringReceiver
 from source.coap_core.coap_utilities.coap_queue import CoapQueue
 from source.coap_core.coap_utilities.coap_logger import logger, LogColor
-from threading import Event
 from source.coap_core.coap_packet.coap_packet import CoapPacket
-from source.coap_core.coap_utilities.coap_timer import CoapTimer
 
+# Bound once at import, they are used for every received packet
+_classify = coap_parse.classify
+_OPTION_DELTAS = CoapOptionDelta._VALUES
+_is_success = CoapCodeFormat.is_success
+_fill_empty_ack = CoapTemplates.EMPTY_ACK.value_into
+_fill_valid_ack = CoapTemplates.SUCCESS_VALID_ACK.value_into
+_now_ns = time.monotonic_ns
 
-class CoapWorkerPool(ABC):
-    CURRENT_TOKEN = -1
+# count().__next__ is a single C call, so tokens are handed out without a lock
+_token_counter = itertools.count().__next__
+_token_pack = struct.Struct(">H").pack
 
-    @staticmethod
-    def __gen_token() -> bytes:
-        CoapWorkerPool.CURRENT_TOKEN += 1
-        CoapWorkerPool.CURRENT_TOKEN = CoapWorkerPool.CURRENT_TOKEN
-        return int(CoapWorkerPool.CURRENT_TOKEN).to_bytes()
 
-    @staticmethod
-    def __verify_format(task) -> bool:
-        if (task.version != 1
-                or not CoapType.is_valid(task.message_type)
-                or not CoapCodeFormat.is_valid(task.code)
-                or not CoapOptionDelta.is_valid(task.options)):
-            return False
+def _gen_token() -> bytes:
+    return _token_pack(_token_counter() & 0xFFFF)
 
-        return True
 
-    def __init__(self, ip_address: str, port: int):
+def _verify_format(task) -> int:
+    """
+    Returns the coap_parse tag of the packet, TAG_INVALID when its format is not valid.
+    """
+    tag = _classify(task.version, task.message_type, task.code)
+    if tag != coap_parse.TAG_INVALID and not _OPTION_DELTAS.issuperset(task.options):
+        return coap_parse.TAG_INVALID
 
-        self.name = f"WorkerPoll"
+    return tag
 
-        self._short_term_shared_work = {}
-        self._long_term_shared_work = {}
-        self._failed_requests = {}
 
-        self._socket = socket(AF_INET, SOCK_DGRAM, IPPROTO_UDP)
-        self._socket.bind((ip_address, port))
+class CoapWorkerPool:
+    # maximum time (nanoseconds) a reply waits for the other replies of its burst before being sent
+    ACK_BATCH_WINDOW_NS = 500_000
+
+    # seconds between two sweeps of the expired work ids
+    WORK_SWEEP_INTERVAL = 30
+
+    # longest time (seconds) a background thread waiting for work takes to notice that the pool was stopped
+    WAKE_UP_INTERVAL = 5
 
-        self.__workers: list[CoapWorker] = []
+    def __init__(self, ip_address: str, port: int, listeners: int = 1):
+        """
+        Args:
+            ip_address (str): Address the pool listens on.
+            port (int): Port the pool listens on.
+            listeners (int): Number of sockets bound to the address with SO_REUSEPORT, each one with its own
+                             receive loop and format filter; the kernel spreads the clients over them.
 
-        self.__received_packets = Queue()
-        self.__valid_coap_packets = Queue()
+        Raises:
+            ValueError: When listeners is lower than 1.
+        """
+
+        if listeners < 1:
+            raise ValueError(f"A worker pool needs at least one listener, got {listeners}")
+
+        self.name = f"WorkerPoll"
 
-        self.__event_check_idle = Event()
-        self.__event_handle_transactions = Event()
-        self.__event_deduplication = Event()
+        self._short_term_shared_work = CoapDedupTable()
+        self._long_term_shared_work = CoapDedupTable()
+        self._failed_requests = {}
+
+        self._sockets: list[socket] = self.__create_sockets(ip_address, port, listeners)
+        self._socket = self._sockets[0]
+
+        # the receive backend and the queue of received datagrams of each socket
+        self.__receivers: list[CoapUringReceiver | CoapBatchReceiver | None] = [
+            self.__create_receiver(skt) for skt in self._sockets
+        ]
+        self.__received_packets: list[CoapQueue] = [CoapQueue() for _ in self._sockets]
+
+        # workers by id; the tuple is an immutable snapshot of them for the per-packet lookups
+        self.__workers: dict[int, CoapWorker] = {}
+        self.__workers_snapshot: tuple[CoapWorker, ...] = ()
+        self.__worker_ids = itertools.count()
+        self.__workers_lock = threading.Lock()
+        # (queue size, worker id) entries, refreshed lazily when popped
+        self.__load_heap: list[tuple[int, int]] = []
+
+        # released by the workers whose idle time crossed __allowed_idle_time
+        self.__idle_workers = threading.Semaphore(0)
         self.__stop_event = threading.Event()
 
         self.__max_queue_size = 20000
-        self.__allowed_idle_time = 60
+        # nanoseconds, compared with CoapWorker.get_idle_time()
+        self.__allowed_idle_time = 60 * 1_000_000_000
 
         self.__background_threads: list[threading.Thread] = [
             threading.Thread(target=self.check_idle_workers),
-            threading.Thread(target=self.coap_format_filter),
-            threading.Thread(target=self.deduplication_filter),
             threading.Thread(target=self.handle_transactions),
+            threading.Thread(target=self.sweep_shared_work),
         ]
+        for index in range(len(self._sockets)):
+            self.__background_threads.append(threading.Thread(target=self.coap_format_filter, args=(index,)))
+        # the first socket is received from by listen() itself
+        for index in range(1, len(self._sockets)):
+            self.__background_threads.append(threading.Thread(target=self.__receive, args=(index,)))
 
         self.__stopping_thread: threading.Thread = threading.Thread(target=self.__safe_stop)
         self.__is_running = True
 
         self.__transaction_pool = CoapTransactionPool()
+        self.__packet_pool = CoapPacketPool()
+
+    def __create_sockets(self, ip_address: str, port: int, count: int) -> list[socket]:
+        if count > 1 and not hasattr(_socket, "SO_REUSEPORT"):
+            logger.debug(f"{self.name} SO_REUSEPORT unavailable, listening on a single socket")
+            count = 1
+
+        sockets = []
+        address = (ip_address, port)
+        for _ in range(count):
+            skt = socket(AF_INET, SOCK_DGRAM, IPPROTO_UDP)
+            if count > 1:
+                skt.setsockopt(SOL_SOCKET, _socket.SO_REUSEPORT, 1)
+            skt.bind(address)
+            # the next sockets share the port of the first one, even when it was picked by the system
+            address = skt.getsockname()
+            sockets.append(skt)
+
+        return sockets
+
+    def __create_receiver(self, skt: socket) -> CoapUringReceiver | CoapBatchReceiver | None:
+        """
+        Pick the fastest receive backend available: io_uring multishot recvmsg (Linux >= 6.0),
+        then recvmmsg batches (Linux), otherwise None and the receive loop falls back to recvfrom.
+        """
+        if CoapUringReceiver.is_supported():
+            try:
+                return CoapUringReceiver(skt)
+            except OSError as e:
+                logger.debug(f"{self.name} io_uring receiver unavailable: {e}")
+
+        # every backend blocks for at most one second, so the receive loop notices when the pool is stopped
+        set_receive_timeout(skt, 1)
+
+        if CoapBatchReceiver.is_supported():
+            return CoapBatchReceiver(skt)
+
+        return None
 
     def add_background_thread(self, thread: threading.Thread):
         self.__background_threads.append(thread)
 
     def remove_short_term_work(self, work_data: tuple):
-        if work_data in self._short_term_shared_work:
-            self._short_term_shared_work.pop(work_data)
+        self._short_term_shared_work.remove(work_data)
 
     def remove_long_term_work(self, work_data: tuple):
-        if work_data in self._long_term_shared_work:
-            self._long_term_shared_work.pop(work_data)
+        self._long_term_shared_work.remove(work_data)
 
     @logger
     def _create_worker(self) -> CoapWorker:
         chosen_worker = CoapWorker(self)
         chosen_worker.start()
 
-        self.__workers.append(chosen_worker)
+        with self.__workers_lock:
+            worker_id = next(self.__worker_ids)
+            self.__workers[worker_id] = chosen_worker
+            self.__workers_snapshot = tuple(self.__workers.values())
+            heapq.heappush(self.__load_heap, (0, worker_id))
 
         return chosen_worker
 
-    def _choose_worker(self) -> CoapWorker:
-        light_loaded_workers = filter(lambda worker: not worker.is_heavily_loaded(), self.__workers)
-        available_workers = filter(lambda worker: worker.get_queue_size() < self.__max_queue_size, light_loaded_workers)
-        chosen_worker = min(available_workers, default=None, key=lambda x: x.get_queue_size())
-
+    def __remove_worker(self, worker_id: int):
+        # the heap entries of the removed worker are skipped when they are popped
+        with self.__workers_lock:
+            del self.__workers[worker_id]
+            self.__workers_snapshot = tuple(self.__workers.values())
+
+    def _choose_worker(self, packet: CoapPacket) -> CoapWorker:
+        # packets from the same client go to the same worker, which keeps their order without scanning the pool
+        workers = self.__workers_snapshot
+        if workers:
+            worker = workers[hash(packet.sender_ip_port) % len(workers)]
+            if not worker.is_heavily_loaded() and worker.get_queue_size() < self.__max_queue_size:
+                return worker
+
+        # the client's worker is busy with a long transfer: fall back to the least loaded worker
+        chosen_worker = self.__pop_least_loaded_worker()
         if not chosen_worker:
-            new_worker = self._create_worker()
-            return new_worker
+            return self._create_worker()
 
         return chosen_worker
 
+    def __pop_least_loaded_worker(self) -> CoapWorker | None:
+        """
+        Take the least loaded available worker from the heap, in O(log N) per entry.
+
+        An entry is stale when its worker was removed (dropped) or its queue size changed since it was pushed
+        (pushed back with the current size). Heavily loaded or full workers are put back once a worker was chosen.
+        """
+        with self.__workers_lock:
+            heap = self.__load_heap
+            skipped = []
+            chosen_worker = None
+
+            # every worker may be refreshed once, so the search always ends
+            for _ in range(len(heap) + len(self.__workers)):
+                if not heap:
+                    break
+
+                queue_size, worker_id = heapq.heappop(heap)
+                worker = self.__workers.get(worker_id)
+                if not worker:
+                    continue
+
+                current_size = worker.get_queue_size()
+                if current_size != queue_size:
+                    heapq.heappush(heap, (current_size, worker_id))
+                    continue
+
+                if worker.is_heavily_loaded() or current_size >= self.__max_queue_size:
+                    skipped.append((queue_size, worker_id))
+                    continue
+
+                chosen_worker = worker
+                heapq.heappush(heap, (current_size + 1, worker_id))
+                break
+
+            for entry in skipped:
+                heapq.heappush(heap, entry)
+
+            return chosen_worker
+
+    def choose_victim(self, thief: CoapWorker) -> CoapWorker | None:
+        """
+        Pick a random worker, other than the thief, to steal work from.
+        """
+        workers = self.__workers_snapshot
+        if not workers:
+            return None
+        victim = random.choice(workers)
+        return victim if victim is not thief else None
+
+    def get_allowed_idle_time(self) -> int:
+        return self.__allowed_idle_time
+
+    def report_idle_worker(self):
+        self.__idle_workers.release()
+
     @logger
     def check_idle_workers(self):
-        while True:
-            self.__event_check_idle.wait()
-
-            if not self.__is_running:
-                break
+        while self.__is_running:
+            # the timeout only lets the thread notice that the pool was stopped
+            if not self.__idle_workers.acquire(timeout=CoapWorkerPool.WAKE_UP_INTERVAL):
+                continue
 
-            for worker in self.__workers:
+            for worker_id, worker in list(self.__workers.items()):
                 if worker.get_idle_time() > self.__allowed_idle_time and len(self.__workers) > 1:
-                    self.__workers.remove(worker)
+                    self.__remove_worker(worker_id)
                     worker.stop()
 
-            self.__event_check_idle.clear()
-
     @logger
     def handle_transactions(self):
-        while True:
-            self.__event_handle_transactions.wait()
-            CoapTransactionPool().solve_transactions()
-            self.__event_handle_transactions.clear()
+        transaction_pool = self.__transaction_pool
+        while self.__is_running:
+            # sleeps until a transaction is added, then checks the pending ones every SOLVE_INTERVAL
+            if transaction_pool.wait_for_transactions(CoapWorkerPool.WAKE_UP_INTERVAL):
+                transaction_pool.solve_transactions()
+                self.__stop_event.wait(CoapTransactionPool.SOLVE_INTERVAL)
 
     @logger
-    def deduplication_filter(self):
+    def sweep_shared_work(self):
+        """
+        Drop the work ids that were never removed by a worker, e.g. those of the tasks that failed.
+        """
+        while not self.__stop_event.wait(CoapWorkerPool.WORK_SWEEP_INTERVAL):
+            self._short_term_shared_work.sweep()
+            self._long_term_shared_work.sweep()
+
+    @logger
+    def coap_format_filter(self, index: int = 0):
+        """
+        Validate, acknowledge and dispatch the datagrams received on the socket with the given index.
+        """
+        skt = self._sockets[index]
+        received_packets = self.__received_packets[index]
+        # scratch packet for the replies sent from this thread, overwritten for every reply
+        ack = CoapPacket()
+        # the replies to a burst of datagrams leave with a single system call
+        replies = CoapBatchSender(skt)
+        # packets accepted during a burst; they reach the workers only once their ACKs were sent
+        accepted: list[CoapPacket] = []
+
         while self.__is_running:
-            packet: CoapPacket = self.__valid_coap_packets.get()
+            data: tuple[bytes, tuple] = received_packets.get()
+
+            # drain what is already queued, but never hold back the first reply for longer than ACK_BATCH_WINDOW_NS
+            deadline = _now_ns() + CoapWorkerPool.ACK_BATCH_WINDOW_NS
+            while data:
+                self.__filter_datagram(data, skt, ack, replies, accepted)
+                if _now_ns() > deadline:
+                    break
+                data = received_packets.get_nowait()
+
+            replies.flush()
+
+            for packet in accepted:
+                self._choose_worker(packet).submit_task(packet)
+            accepted.clear()
+
+    def __filter_datagram(self, data: tuple[bytes, tuple], skt: socket, ack: CoapPacket, replies: CoapBatchSender,
+                          accepted: list[CoapPacket]):
+        packet = self.__packet_pool.acquire()
+        try:
+            CoapPacket.decode_into(data[0], data[1], skt, packet)
+        except (ValueError, IndexError):
+            logger.debug(f"{self.name} Malformed datagram from {data[1]}: {data[0]}")
+            self.__packet_pool.release(packet)
+            return
+
+        # verifying the integrity of the packet
+        tag = _verify_format(packet)
+        match tag:
+
+            case coap_parse.TAG_CON | coap_parse.TAG_CON_CONTENT:
+                if not self.__transaction_pool.is_overall_transaction_failed(packet):
+                    if tag == coap_parse.TAG_CON_CONTENT:  # CONTENT
+                        _fill_valid_ack(ack, packet.token, packet.message_id)
+                        block_id = packet.get_block_id()
+                        ack.payload = str(block_id)
+                    else:  # GET PUT POST DELETE FETCH and the other codes
+                        _fill_empty_ack(ack, packet.token, packet.message_id)
+
+                    replies.add_packet(ack, packet.sender_ip_port)
+                    # the packet now belongs to the workers, unless it is a duplicate
+                    self.__deduplicate(packet, accepted)
+                    return
+
+            case coap_parse.TAG_ACK:
+                CoapTransactionPool().finish_transaction(packet)
+
+            case coap_parse.TAG_RST:
+                self._failed_requests[packet.general_work_id()] = _now_ns()
+                self.__transaction_pool.set_overall_transaction_failure(packet)
+                self.__transaction_pool.finish_overall_transaction(packet)
+                logger.log(f"! Warning: {CoapCodeFormat.get_field_name(packet.code)}", LogColor.YELLOW)
+
+            case coap_parse.TAG_NON:
+                pass
 
-            with (CoapTimer()):
+            case _:
+                logger.debug(f"{self.name} Invalid coap format: \n {packet.__repr__()}")
 
-                work = packet.short_term_work_id()
+                CoapTemplates.NON_COAP_FORMAT.value_into(ack, packet.token, packet.message_id)
+                ack.code = CoapCodeFormat.SERVER_ERROR_INTERNAL_SERVER_ERROR.value()
 
-                long_term_work = None
-                # When a content response is received, the initial request may not have received the
-                # acknowledgment, but it's clear that the client/server got the request.
-                # The initial transaction related to the request must be finished.
-                if CoapCodeFormat.is_success(packet.code) and packet.has_option_block():
-                    # if a block 2/1 option is included, it's clear that this is
-                    # a long-term request, and it must be handled properly
-                    long_term_work = packet.long_term_work_id()
+                replies.add_packet(ack, packet.sender_ip_port)
 
-                if (work not in self._short_term_shared_work
-                        and long_term_work not in self._long_term_shared_work):
+        self.__packet_pool.release(packet)
 
-                    self._choose_worker().submit_task(packet)
+    def __deduplicate(self, packet: CoapPacket, accepted: list[CoapPacket]):
+        """
+        Add the packet to the accepted ones, unless its work is already in progress.
+        Runs in the format filter thread, right after the packet's ACK was queued; the accepted packets are
+        submitted to the workers after the ACKs were flushed, so a response never overtakes its ACK.
+        """
+        work = packet.short_term_work_id()
 
-                    if long_term_work:
-                        self._long_term_shared_work[long_term_work] = time.time()
-                    else:
-                        self._short_term_shared_work[work] = time.time()
-                else:
-                    logger.debug(f"{self.name} Packet duplicated: \n {packet.__repr__()}")
+        long_term_work = None
+        # When a content response is received, the initial request may not have received the
+        # acknowledgment, but it's clear that the client/server got the request.
+        # The initial transaction related to the request must be finished.
+        if _is_success(packet.code) and packet.has_option_block():
+            # if a block 2/1 option is included, it's clear that this is
+            # a long-term request, and it must be handled properly
+            long_term_work = packet.long_term_work_id()
 
-    @logger
-    def coap_format_filter(self):
+        if (work not in self._short_term_shared_work
+                and long_term_work not in self._long_term_shared_work):
 
-        while self.__is_running:
-            data: tuple[bytes, tuple] = self.__received_packets.get()
-            packet = CoapPacket.decode(data[0], data[1], self._socket)
-            # verifying the integrity of the packet
-            if CoapWorkerPool.__verify_format(packet):
-                match packet.message_type:
-
-                    case CoapType.CON.value:
-                        if not self.__transaction_pool.is_overall_transaction_failed(packet):
-                            if CoapCodeFormat.is_method(packet.code):  # GET PUT POST DELETE FETCH
-                                ack = CoapTemplates.EMPTY_ACK.value_with(packet.token, packet.message_id)
-                            elif packet.code == CoapCodeFormat.SUCCESS_CONTENT.value():  # CONTENT
-                                ack = CoapTemplates.SUCCESS_VALID_ACK.value_with(packet.token, packet.message_id)
-                                block_id = packet.get_block_id()
-                                ack.payload = str(block_id)
-                            else:
-                                ack = CoapTemplates.EMPTY_ACK.value_with(packet.token, packet.message_id)
-
-                            self._socket.sendto(ack.encode(), packet.sender_ip_port)
-                            self.__valid_coap_packets.put(packet)
-
-                    case CoapType.ACK.value:
-                        CoapTransactionPool().finish_transaction(packet)
-
-                    case CoapType.RST.value:
-                        self._failed_requests[packet.general_work_id()] = time.time()
-                        self.__transaction_pool.set_overall_transaction_failure(packet)
-                        self.__transaction_pool.finish_overall_transaction(packet)
-                        logger.log(f"! Warning: {CoapCodeFormat.get_field_name(packet.code)}", LogColor.YELLOW)
-
-                    case _:
-                        pass
+            # recorded right away, so the duplicates within the same burst are dropped as well
+            if long_term_work:
+                self._long_term_shared_work.add(long_term_work)
             else:
-                logger.debug(f"{self.name} Invalid coap format: \n {packet.__repr__()}")
-
-                invalid_format = CoapTemplates.NON_COAP_FORMAT.value_with(packet.token, packet.message_id)
-                invalid_format.code = CoapCodeFormat.SERVER_ERROR_INTERNAL_SERVER_ERROR.value()
+                self._short_term_shared_work.add(work)
 
-                self._socket.sendto(invalid_format.encode(), packet.sender_ip_port)
+            accepted.append(packet)
+        else:
+            logger.debug(f"{self.name} Packet duplicated: \n {packet.__repr__()}")
+            self.__packet_pool.release(packet)
 
     @logger
     def listen(self):
@@ -207,24 +409,36 @@ class CoapWorkerPool(ABC):
         for thread in self.__background_threads:
             thread.start()
 
-        while self.__is_running:
-            try:
-                active_socket, _, _ = select([self._socket], [], [], 1)
+        self.__receive(0)
+
+        self.__stop_event.set()
 
-                if active_socket:
-                    data, address = self._socket.recvfrom(1152)
-                    self.__received_packets.put((data, address))
+    def __receive(self, index: int):
+        """
+        Receive loop of the socket with the given index, feeding its format filter until the pool is stopped.
+        """
+        skt = self._sockets[index]
+        receiver = self.__receivers[index]
+        received_packets = self.__received_packets[index]
 
-                self.__event_handle_transactions.set()
-                self.__event_check_idle.set()
+        while self.__is_running:
+            try:
+                if receiver:
+                    for data, address in receiver.receive():
+                        received_packets.put((data, address))
+                else:
+                    # a single blocking receive, SO_RCVTIMEO wakes it up every second
+                    try:
+                        data, address = skt.recvfrom(1152)
+                        received_packets.put((data, address))
+                    except (BlockingIOError, TimeoutError):
+                        pass
             except Exception:
                 pass
 
-        self.__stop_event.set()
-
     def handle_internal_task(self, task: CoapPacket):
         # give unique token
-        task.token = CoapWorkerPool.__gen_token()
+        task.token = _gen_token()
         if task.needs_internal_computation:
             self._create_worker().submit_task(task)
         self.__transaction_pool.add_transaction(task)
@@ -238,12 +452,16 @@ class CoapWorkerPool(ABC):
 
         self.__is_running = False
 
-        for worker in self.__workers:
+        for worker in self.__workers_snapshot:
             worker.stop()
 
-        for worker in self.__workers:
+        for worker in self.__workers_snapshot:
             worker.join()
 
-        self._socket.close()
+        for receiver in self.__receivers:
+            if receiver:
+                receiver.close()
+        for skt in self._sockets:
+            skt.close()
 
         sys.exit(0)
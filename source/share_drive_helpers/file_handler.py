@@ -2,7 +2,6 @@ import json
 import os
 import random
 import threading
-from copy import deepcopy
 from functools import singledispatchmethod
 
 from tqdm import tqdm
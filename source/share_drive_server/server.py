@@ -6,8 +6,8 @@ from source.coap_core.coap_resource.resource_manager import ResourceManager
 
 
 class Server(CoapWorkerPool):
-    def __init__(self, ip_address, port):
-        super().__init__(ip_address, port)
+    def __init__(self, ip_address, port, listeners=1):
+        super().__init__(ip_address, port, listeners)
 
         ResourceManager().set_root_path("/home/damir/coap/server/resources/")
         ResourceManager().discover_resources()
@@ -19,9 +19,12 @@ def main():
 
     parser.add_argument('--server_address', type=str, default='127.0.0.1', help='Server address')
     parser.add_argument('--server_port', type=int, default=5683, help='Server port')
+    parser.add_argument('--listeners', type=int, default=1, help='Number of sockets sharing the server port')
 
     args = parser.parse_args()
+    if args.listeners < 1:
+        parser.error('--listeners must be at least 1')
 
-    Server(args.server_address, args.server_port).listen()
+    Server(args.server_address, args.server_port, args.listeners).listen()
 
 main()
\ No newline at end of file